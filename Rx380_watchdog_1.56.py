@@ -1,15 +1,14 @@
 import asyncio
-import minimalmodbus
-import csv
 import logging
+import operator
 from datetime import datetime, timedelta
-import pymssql
-import json
-from pathlib import Path
+
+from rx380 import REGISTER_TABLE, RX380, load_config
+from rx380.app import close_device, format_timestamp, set_io_executor
+from rx380.sinks import CsvSink, SqlSink, row_fields
 
 # Load configuration from config.json
-with open('config.json') as config_file:
-    config = json.load(config_file)
+config = load_config('config.json')
 
 # Set up logging
 logging.basicConfig(filename='rx380_logger.log', level=logging.INFO,
@@ -19,174 +18,48 @@ console = logging.StreamHandler()
 console.setLevel(logging.INFO)
 logging.getLogger('').addHandler(console)
 
-class RX380:
-    """Class to handle Modbus communication with RX380 device."""
-    def __init__(self, port='/dev/ttyUSB0', slave_address=1):
-        self.instrument = minimalmodbus.Instrument(port, slave_address)
-        self.setup_instrument()
-
-    def setup_instrument(self):
-        """Configure the Modbus instrument settings."""
-        self.instrument.serial.baudrate = 19200
-        self.instrument.serial.bytesize = 8
-        self.instrument.serial.parity = minimalmodbus.serial.PARITY_EVEN
-        self.instrument.serial.stopbits = 1
-        self.instrument.serial.timeout = 1
-        self.instrument.mode = minimalmodbus.MODE_RTU
-
-    async def read_scaled_value(self, register_address, scale_factor):
-        """Read and scale values from the Modbus registers."""
-        try:
-            raw_value = await asyncio.to_thread(
-                self.instrument.read_registers, register_address, 2, functioncode=4
-            )
-            value = (raw_value[0] << 16 | raw_value[1]) * scale_factor
-            return value
-        except Exception as e:
-            logging.error(f"Error reading scaled value from register {register_address}: {e}")
-            return None
-
-    async def read_register(self, register_address, number_of_decimals, signed):
-        """Read a single register value."""
-        try:
-            return await asyncio.to_thread(
-                self.instrument.read_register, register_address, number_of_decimals, signed=signed, functioncode=4
-            )
-        except Exception as e:
-            logging.error(f"Error reading register {register_address}: {e}")
-            return None
-
-    async def read_data(self):
-        """Read all necessary data from RX380."""
-        data = {}
-        try:
-            # Read voltages
-            data['voltage_l1'] = await self.read_scaled_value(4034, 0.1)  # V
-            data['voltage_l2'] = await self.read_scaled_value(4036, 0.1)  # V
-            data['voltage_l3'] = await self.read_scaled_value(4038, 0.1)  # V
-            data['voltage_l12'] = await self.read_scaled_value(4028, 0.1)  # V
-            data['voltage_l23'] = await self.read_scaled_value(4030, 0.1)  # V
-            data['voltage_l31'] = await self.read_scaled_value(4032, 0.1)  # V
-
-            # Read max voltages
-            data['voltage_l12_max'] = await self.read_scaled_value(4124, 0.1)  # V
-            data['voltage_l23_max'] = await self.read_scaled_value(4128, 0.1)  # V
-            data['voltage_l31_max'] = await self.read_scaled_value(4132, 0.1)  # V
-
-            # Read min voltages
-            data['voltage_l12_min'] = await self.read_scaled_value(4212, 0.1)  # V
-            data['voltage_l23_min'] = await self.read_scaled_value(4216, 0.1)  # V
-            data['voltage_l31_min'] = await self.read_scaled_value(4220, 0.1)  # V
-
-            # Read current
-            data['current_l1'] = await self.read_scaled_value(4020, 0.001)  # A
-            data['current_l2'] = await self.read_scaled_value(4022, 0.001)  # A
-            data['current_l3'] = await self.read_scaled_value(4024, 0.001)  # A
-            data['current_ln'] = await self.read_scaled_value(4026, 0.001)  # A
-
-            # Read power
-            data['total_real_power'] = await self.read_scaled_value(4012, 1)  # W
-            data['total_apparent_power'] = await self.read_scaled_value(4014, 1)  # VA
-            data['total_reactive_power'] = await self.read_scaled_value(4016, 1)  # VAR
-
-            # Read power factor and frequency
-            data['total_power_factor'] = await self.read_register(4018, 3, True)
-            data['frequency'] = await self.read_register(4019, 2, False)  # Hz
-
-            # Read energy
-            data['total_real_energy'] = await self.read_scaled_value(4002, 1)  # kWh
-            data['total_reactive_energy'] = await self.read_scaled_value(4010, 1)  # kVARh
-            data['total_apparent_energy'] = await self.read_scaled_value(4006, 1)  # kVAh
-
-            return data
-        except Exception as e:
-            logging.error(f"Error reading data: {e}")
-            return None
+# Pulls a reading's values out in Office_Readings column order
+ROW_GETTER = operator.itemgetter(*row_fields())
+
+# The measured values, compared to spot readings unchanged since the previous one
+VALUES_GETTER = operator.itemgetter(*row_fields()[1:])
 
 class DataManager:
-    """Class to handle data storage in SQL and CSV."""
+    """Class to spot readings unchanged since the previous one."""
     def __init__(self):
-        self.db_config = {
-            'server': '192.168.0.226',
-            'database': 'Power_Usage_Alumac',
-            'user': 'sa',
-            'password': 'password'
-        }
-
-    async def save_to_sql(self, data_buffer):
-        """Save data to SQL Server with error handling."""
-        insert_query = """
-        INSERT INTO Office_Readings 
-           (Timestamp, VoltageL1_v, VoltageL2_v, VoltageL3_v, VoltageL12_v, VoltageL23_v, VoltageL31_v,
-            VoltageL12_maxv, VoltageL23_maxv, VoltageL31_maxv, VoltageL12_minv, VoltageL23_minv, VoltageL31_minv,
-            CurrentL1_I, CurrentL2_I, CurrentL3_I, CurrentLn_I,
-            TotalRealPower_kWh, TotalApparentPower_kWh, TotalReactivePower_kWh, TotalPowerFactor_kWh, Frequency,
-            TotalRealEnergy, TotalReactiveEnergy, TotalApparentEnergy)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        try:
-            conn = await asyncio.to_thread(pymssql.connect, **self.db_config)
-            cursor = conn.cursor()
-            for data in data_buffer:
-                values = (
-                    data['timestamp'],
-                    data['voltage_l1'], data['voltage_l2'], data['voltage_l3'],
-                    data['voltage_l12'], data['voltage_l23'], data['voltage_l31'],
-                    data['voltage_l12_max'], data['voltage_l23_max'], data['voltage_l31_max'],
-                    data['voltage_l12_min'], data['voltage_l23_min'], data['voltage_l31_min'],
-                    data['current_l1'], data['current_l2'], data['current_l3'], data['current_ln'],
-                    data['total_real_power'] / 1000, data['total_apparent_power'] / 1000, data['total_reactive_power'] / 1000,
-                    data['total_power_factor'], data['frequency'],
-                    data['total_real_energy'], data['total_reactive_energy'], data['total_apparent_energy']
-                )
-                await asyncio.to_thread(cursor.execute, insert_query, values)
-            await asyncio.to_thread(conn.commit)
-            logging.info(f"Data inserted successfully into SQL Server! ({len(data_buffer)} records)")
-        except Exception as e:
-            logging.error(f"Error inserting data into SQL Server: {e}")
-            if 'conn' in locals():
-                await asyncio.to_thread(conn.rollback)
-        finally:
-            if 'cursor' in locals():
-                await asyncio.to_thread(cursor.close)
-            if 'conn' in locals():
-                await asyncio.to_thread(conn.close)
-
-def get_filename(extension):
-    """Generate a filename based on the current date."""
-    today = datetime.now().strftime("%Y-%m-%d")
-    return f"rx380_data_{today}.{extension}"
-
-async def save_to_csv(data, folder_path=None):
-    """Save a single data point to a CSV file."""
-    if folder_path is None:
-        folder_path = Path.home() / "Desktop" / "PUA_Office" / "PUA" / "rx380_daily_logs"
-    folder_path = Path(folder_path)
-    folder_path.mkdir(parents=True, exist_ok=True)
-    
-    filename = folder_path / get_filename("csv")
-    file_exists = filename.is_file()
-    
-    async with asyncio.Lock():
-        with open(filename, 'a', newline='') as csvfile:
-            fieldnames = ['timestamp'] + list(data.keys())
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            if not file_exists:
-                writer.writeheader()
-            
-            writer.writerow(data)
-    
-    logging.info(f"Data saved to CSV file: {filename}")
+        self.last_values = None  # Previous reading's values, rounded for is_duplicate
+
+    def is_duplicate(self, data):
+        """Check whether data matches the previous reading to 3 decimals, remembering it if not."""
+        values = tuple([round(value, 3) for value in VALUES_GETTER(data)])
+        if values == self.last_values:
+            return True
+        self.last_values = values
+        return False
+
+# Readings are queued for SQL Server in batches of SQL_BATCH_SIZE, or whatever has been
+# buffered once SQL_MAX_DELAY seconds have passed since the last batch (failed reads and
+# unchanged readings leave batches short). SqlSink spools a batch it cannot save to disk
+# and saves it once SQL Server is back, so no more than a batch is ever held in memory.
+SQL_BATCH_SIZE = 6
+SQL_MAX_DELAY = 3600
 
 async def main():
     """Main function to handle data reading, saving, and logging."""
-    rx380 = RX380(slave_address=1)
+    set_io_executor()  # asyncio.to_thread calls share two worker threads
+    rx380 = RX380(config.modbus.port, config.modbus.slave_address, max_gap=config.modbus.max_gap)
     data_manager = DataManager()
+    sql_sink = SqlSink(config.database)
+    sql_sink.start()
+    csv_sink = CsvSink(config.csv.folder_path)  # Always on in 1.56, whatever save_csv says
     
     logging.info("Starting RX380 data logging")
     print("RX380 data logging started.")
     
+    data_buffer = []  # Rows not yet queued for SQL Server
+    loop = asyncio.get_running_loop()
+    last_batch = loop.time()  # Monotonic time the last batch was queued
+    
     try:
         # Calculate the next 10-minute mark
         now = datetime.now()
@@ -195,32 +68,56 @@ async def main():
 
         while True:
             # Wait until the next 10-minute mark
-            now = datetime.now()
-            wait_time = (next_save_time - now).total_seconds()
+            wait_time = (next_save_time - datetime.now()).total_seconds()
             if wait_time > 0:
                 await asyncio.sleep(wait_time)
+
+            # Read the clock once per tick; the schedule and timestamp both use it
+            now = datetime.now()
+
+            # Step to the following mark before reading, so a failed read waits for it
+            # instead of retrying in a tight loop; skip any marks missed while stalled
+            next_save_time += timedelta(minutes=10)
+            while next_save_time <= now:
+                next_save_time += timedelta(minutes=10)
             
             # Collect and save a single data point
             data = await rx380.read_data()
             if data:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                timestamp = format_timestamp(now)
                 data['timestamp'] = timestamp
                 logging.info("Data read successfully")
 
-                # Save data to SQL and CSV
-                await data_manager.save_to_sql([data])  # Pass as a list with one data point
-                await save_to_csv(data)
+                # Save data to CSV now, and buffer it for the next SQL batch unless nothing changed
+                row = ROW_GETTER(data)
+                duplicate = data_manager.is_duplicate(data)
+                await csv_sink.write([row], duplicate=duplicate)
+                if duplicate:
+                    logging.info("Reading unchanged since the previous one, not saved to SQL Server")
+                else:
+                    data_buffer.append(row)
                 logging.info(f"Data saved at {timestamp}")
+            else:
+                logging.warning("Failed to read data")
 
-                # Schedule the next save time
-                next_save_time = (datetime.now() + timedelta(minutes=10)).replace(second=0, microsecond=0)
-                logging.info(f"Next data save scheduled at {next_save_time}")
+            # Queue the batch, saved in one transaction, once it is full or an hour old
+            if data_buffer and (len(data_buffer) >= SQL_BATCH_SIZE or loop.time() - last_batch >= SQL_MAX_DELAY):
+                sql_sink.enqueue(data_buffer)
+                data_buffer = []
+                last_batch = loop.time()
+            logging.info(f"Next data save scheduled at {next_save_time}")
 
     except asyncio.CancelledError:
         pass
     except KeyboardInterrupt:
         print("Program interrupted by user. Shutting down...")
     finally:
+        # Queue any rows still buffered; close() saves them, or spools them if SQL Server is down
+        if data_buffer:
+            sql_sink.enqueue(data_buffer)
+        await sql_sink.close()
+        await asyncio.to_thread(csv_sink.close)  # Flushes the file
+        await close_device(rx380)
         logging.info("Shutting down RX380 data logging")
         print("RX380 data logging shut down.")
 
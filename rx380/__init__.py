@@ -0,0 +1,6 @@
+"""RX380 power meter logging: register table, Modbus reader, sinks and sampling loops."""
+from .app import run_aligned, run_buffered, setup_logging
+from .config import Config, load_config
+from .device import RX380
+from .registers import REGISTER_TABLE, Field, RegisterMap, select_fields
+from .sinks import ConsoleDisplay, CsvSink, SqlSink
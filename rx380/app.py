@@ -0,0 +1,202 @@
+"""Sampling loops that read the RX380 on a schedule and hand readings to the sinks."""
+import asyncio
+import logging
+import operator
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from .device import RX380
+from .registers import REGISTER_TABLE
+from .sinks import ConsoleDisplay, CsvSink, SqlSink, row_fields
+
+logger = logging.getLogger(__name__)
+
+IO_WORKERS = 2  # SQL Server and file I/O; the Modbus reads have their own thread
+MARK_TOLERANCE = timedelta(seconds=1)  # A mark this recently passed is still taken as due
+
+def setup_logging(filename='rx380_logger.log', console_level=logging.WARNING):
+    """Log to filename, echoing records at console_level and above to the console."""
+    logging.basicConfig(filename=filename, level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    console = logging.StreamHandler()
+    console.setLevel(console_level)
+    logging.getLogger('').addHandler(console)
+
+def set_io_executor(max_workers=IO_WORKERS):
+    """Bound the default executor behind asyncio.to_thread, so a hung call cannot pile up threads."""
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rx380_io')
+    asyncio.get_running_loop().set_default_executor(executor)  # asyncio.run shuts it down on exit
+    return executor
+
+def format_timestamp(now):
+    """Format a datetime as YYYY-MM-DD HH:MM:SS, cheaper than strftime."""
+    return f"{now.year:04d}-{now.month:02d}-{now.day:02d} {now.hour:02d}:{now.minute:02d}:{now.second:02d}"
+
+def make_device(config, fields, port=None):
+    """Create the RX380 reader from the modbus section of config.json."""
+    return RX380(port or config.modbus.port, config.modbus.slave_address, fields, config.modbus.max_gap)
+
+def make_sinks(config, fields, save_csv=None, spool_file='unsaved_data.ndjson'):
+    """Create the SQL sink, and the CSV sink if enabled (by default, per config.json save_csv)."""
+    sql_sink = SqlSink(config.database, fields, spool_file=spool_file)
+    if save_csv is None:
+        save_csv = config.save_csv
+    csv_sink = CsvSink(config.csv.folder_path, fields) if save_csv else None
+    return sql_sink, csv_sink
+
+async def close_device(rx380):
+    """Close the RX380, on the loop for the asyncio transport or on a thread for the Modbus thread."""
+    if rx380.client is not None:
+        rx380.close()  # The serial transport is not thread-safe, so it must be closed on the loop
+    else:
+        await asyncio.to_thread(rx380.close)  # Waits for the Modbus thread to finish
+
+async def shut_down(rx380, sql_sink, csv_sink):
+    """Save everything still queued and release the device and files."""
+    await sql_sink.close()  # Saves everything still queued
+    # Closing flushes the CSV file, so keep it off the event loop
+    if csv_sink is not None:
+        await asyncio.to_thread(csv_sink.close)
+    await close_device(rx380)
+    logger.info("Shutting down RX380 data logging")
+    print("RX380 data logging shut down.")
+
+async def read_loop(rx380, data_buffer, flush_event, read_interval, flush_every, display):
+    """Read data into the buffer every read_interval seconds, signalling when a flush is due."""
+    loop = asyncio.get_running_loop()
+    next_read = loop.time()
+
+    while True:
+        try:
+            data = await rx380.read_data()
+            if data:
+                data['timestamp'] = format_timestamp(datetime.now())
+                data_buffer.append(data)
+                logger.info("Data read successfully")
+                if display is not None:
+                    display.show(data)
+
+                if len(data_buffer) >= flush_every:
+                    flush_event.set()
+            else:
+                logger.warning("Failed to read data")
+        except Exception as e:
+            logger.error("Error in main loop: %s", e)
+            print(f"Error: {e}")
+
+        # Sleep against a monotonic deadline, so loop time does not add drift
+        next_read += read_interval
+        delay = next_read - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            logger.warning("Read cycle overran by %.3fs", -delay)
+            next_read = loop.time()
+
+def take_rows(data_buffer, row_getter):
+    """Empty the buffer, returning its readings as rows in column order."""
+    rows = list(map(row_getter, data_buffer))
+    data_buffer.clear()
+    return rows
+
+async def save_rows(rows, sql_sink, csv_sink):
+    """Queue rows for SQL and save them to CSV, if enabled."""
+    sql_sink.enqueue(rows)
+    if csv_sink is not None:
+        await csv_sink.write(rows)
+
+async def flush_loop(sql_sink, csv_sink, data_buffer, flush_event, row_getter):
+    """Save buffered data whenever read_loop signals a flush."""
+    while True:
+        await flush_event.wait()
+        flush_event.clear()
+        try:
+            await save_rows(take_rows(data_buffer, row_getter), sql_sink, csv_sink)
+        except Exception as e:
+            logger.error("Error saving data: %s", e)
+            print(f"Error: {e}")
+
+async def run_buffered(config, fields=REGISTER_TABLE, port=None, read_interval=10, flush_every=6,
+                       save_csv=None, display=True, spool_file='unsaved_data.ndjson'):
+    """Read every read_interval seconds and save the readings every flush_every reads."""
+    set_io_executor()
+    rx380 = make_device(config, fields, port)
+    sql_sink, csv_sink = make_sinks(config, fields, save_csv, spool_file)
+    sql_sink.start()
+    row_getter = operator.itemgetter(*row_fields(fields))
+
+    logger.info("Starting RX380 data logging")
+    print("RX380 data logging started.")
+
+    # Bounded to 24 hours of readings; the oldest are dropped if flushes stall
+    data_buffer = deque(maxlen=int(24 * 3600 / read_interval))
+    flush_event = asyncio.Event()
+    tasks = [
+        asyncio.create_task(read_loop(rx380, data_buffer, flush_event, read_interval, flush_every,
+                                      ConsoleDisplay(every=int(120 / read_interval)) if display else None)),
+        asyncio.create_task(flush_loop(sql_sink, csv_sink, data_buffer, flush_event, row_getter)),
+    ]
+
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        pass
+    except KeyboardInterrupt:
+        print("Program interrupted by user. Shutting down...")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Save any remaining data in the buffer; a failure here must not skip shut_down
+        if data_buffer:
+            try:
+                await save_rows(take_rows(data_buffer, row_getter), sql_sink, csv_sink)
+            except Exception as e:
+                logger.error("Error saving remaining data: %s", e)
+        await shut_down(rx380, sql_sink, csv_sink)
+
+async def run_aligned(config, fields=REGISTER_TABLE, port=None, interval_minutes=10,
+                      save_csv=None, spool_file='unsaved_data.ndjson'):
+    """Read and save one reading at each interval_minutes mark of the clock (e.g., :00, :10, :20)."""
+    set_io_executor()
+    rx380 = make_device(config, fields, port)
+    sql_sink, csv_sink = make_sinks(config, fields, save_csv, spool_file)
+    sql_sink.start()
+    row_getter = operator.itemgetter(*row_fields(fields))
+    interval = timedelta(minutes=interval_minutes)
+
+    logger.info("Starting RX380 data logging")
+    print("RX380 data logging started.")
+
+    last_mark = None
+    try:
+        while True:
+            # Sleep until the next interval mark. The monotonic sleep can wake just short of the
+            # wall-clock mark, so a mark already handled is skipped rather than saved twice.
+            now = datetime.now()
+            mark = now.replace(minute=now.minute - now.minute % interval_minutes, second=0, microsecond=0)
+            if mark == last_mark or now - mark > MARK_TOLERANCE:
+                mark += interval
+            await asyncio.sleep(max((mark - now).total_seconds(), 0))
+            last_mark = mark
+
+            data = await rx380.read_data()
+            if data:
+                data['timestamp'] = format_timestamp(datetime.now())
+                try:
+                    await save_rows([row_getter(data)], sql_sink, csv_sink)
+                    logger.info("Data saved at standardized %s-minute interval", interval_minutes)
+                except Exception as e:
+                    logger.error("Error saving data: %s", e)
+                    print(f"Error: {e}")
+            else:
+                logger.warning("Failed to read data")
+    except asyncio.CancelledError:
+        pass
+    except KeyboardInterrupt:
+        print("Program interrupted by user. Shutting down...")
+    finally:
+        await shut_down(rx380, sql_sink, csv_sink)
@@ -0,0 +1,58 @@
+"""Configuration loading, into frozen dataclasses decoded with msgspec when installed."""
+import json
+from dataclasses import dataclass, field, fields, is_dataclass, replace
+from pathlib import Path
+from types import MappingProxyType
+from typing import Optional
+
+from .registers import MAX_BLOCK_GAP
+
+try:
+    import msgspec
+except ImportError:  # msgspec is optional, fall back to building the dataclasses by hand
+    msgspec = None
+
+DEFAULT_CSV_FOLDER = Path.home() / "Desktop" / "PUA_Office" / "PUA" / "rx380_daily_logs"
+
+@dataclass(frozen=True)
+class ModbusConfig:
+    """Serial port and slave address of the RX380, and how many unused registers a block read may span."""
+    port: str = '/dev/ttyUSB0'
+    slave_address: int = 1
+    max_gap: int = MAX_BLOCK_GAP
+
+@dataclass(frozen=True)
+class CsvConfig:
+    """Where the daily CSV files go; None means DEFAULT_CSV_FOLDER."""
+    folder_path: Optional[str] = None
+
+@dataclass(frozen=True)
+class Config:
+    """Contents of config.json. database holds the pymssql.connect arguments."""
+    database: dict
+    modbus: ModbusConfig = field(default_factory=ModbusConfig)
+    save_csv: bool = False
+    csv: CsvConfig = field(default_factory=CsvConfig)
+    retry_attempts: int = 5
+    reading_interval_normal: float = 10
+    reading_interval_high: float = 30
+
+def from_dict(cls, values):
+    """Build a config dataclass from a dict, ignoring unknown keys as msgspec does."""
+    kwargs = {}
+    for config_field in fields(cls):
+        if config_field.name in values:
+            value = values[config_field.name]
+            if is_dataclass(config_field.type):
+                value = from_dict(config_field.type, value)
+            kwargs[config_field.name] = value
+    return cls(**kwargs)
+
+def load_config(path='config.json'):
+    """Load config.json, freezing the database settings into a read-only mapping."""
+    data = Path(path).read_bytes()
+    if msgspec is not None:
+        config = msgspec.json.decode(data, type=Config)
+    else:
+        config = from_dict(Config, json.loads(data))
+    return replace(config, database=MappingProxyType(config.database))
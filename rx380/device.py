@@ -0,0 +1,72 @@
+"""Modbus RTU communication with the RX380 power meter."""
+import asyncio
+import logging
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import minimalmodbus
+
+from .registers import MAX_BLOCK_GAP, REGISTER_TABLE, RegisterMap
+
+try:
+    from .rtu import AsyncRtuClient
+except ImportError:  # pyserial-asyncio-fast is optional, fall back to minimalmodbus on a thread
+    AsyncRtuClient = None
+
+logger = logging.getLogger(__name__)
+
+class RX380:
+    """Class to handle Modbus communication with RX380 device."""
+    def __init__(self, port='/dev/ttyUSB0', slave_address=1, fields=REGISTER_TABLE, max_gap=MAX_BLOCK_GAP):
+        self.registers = RegisterMap(fields, max_gap)
+        self.client = None
+        self.instrument = None
+        self.executor = None
+        if AsyncRtuClient is not None:
+            # Reads run on the event loop, with no thread hop per request
+            self.client = AsyncRtuClient(port, slave_address)
+        else:
+            self.instrument = minimalmodbus.Instrument(port, slave_address)
+            self.setup_instrument()
+            # The serial port handles one request at a time, so all Modbus I/O runs on one thread
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="modbus")
+
+    def setup_instrument(self):
+        """Configure the Modbus instrument settings."""
+        self.instrument.serial.baudrate = 19200
+        self.instrument.serial.bytesize = 8
+        self.instrument.serial.parity = minimalmodbus.serial.PARITY_EVEN
+        self.instrument.serial.stopbits = 1
+        self.instrument.serial.timeout = 1
+        self.instrument.mode = minimalmodbus.MODE_RTU
+
+    def read_blocks(self):
+        """Read every register block, one request each, on the Modbus thread."""
+        return b''.join([
+            struct.pack(f'>{count}H', *self.instrument.read_registers(start_address, count, functioncode=4))
+            for start_address, count in self.registers.blocks
+        ])
+
+    async def read_data(self):
+        """Read all configured fields from RX380."""
+        try:
+            if self.client is not None:
+                raw = b''.join([
+                    await self.client.read_input_bytes(start_address, count)
+                    for start_address, count in self.registers.blocks
+                ])
+            else:
+                loop = asyncio.get_running_loop()
+                raw = await loop.run_in_executor(self.executor, self.read_blocks)
+            return self.registers.decode(raw)
+        except Exception as e:
+            logger.error("Error reading data: %s", e)
+            return None
+
+    def close(self):
+        """Close the serial port, stopping the Modbus thread if one is used."""
+        if self.client is not None:
+            self.client.close()
+        else:
+            self.executor.shutdown(wait=True)
+            self.instrument.serial.close()
@@ -0,0 +1,92 @@
+"""RX380 register table, and the block reads and struct decoding derived from it."""
+import struct
+from collections import namedtuple
+
+# name: key in the data dict, address: first input register, type: 'u32', 'u16' or 's16',
+# scale: multiplier applied to the raw value, column: Office_Readings column
+Field = namedtuple('Field', ['name', 'address', 'type', 'scale', 'column'])
+
+# Every RX380 field logged, in Office_Readings column order
+REGISTER_TABLE = (
+    # Voltages
+    Field('voltage_l1', 4034, 'u32', 0.1, 'VoltageL1_v'),  # V
+    Field('voltage_l2', 4036, 'u32', 0.1, 'VoltageL2_v'),  # V
+    Field('voltage_l3', 4038, 'u32', 0.1, 'VoltageL3_v'),  # V
+    Field('voltage_l12', 4028, 'u32', 0.1, 'VoltageL12_v'),  # V
+    Field('voltage_l23', 4030, 'u32', 0.1, 'VoltageL23_v'),  # V
+    Field('voltage_l31', 4032, 'u32', 0.1, 'VoltageL31_v'),  # V
+
+    # Max voltages
+    Field('voltage_l12_max', 4124, 'u32', 0.1, 'VoltageL12_maxv'),  # V
+    Field('voltage_l23_max', 4128, 'u32', 0.1, 'VoltageL23_maxv'),  # V
+    Field('voltage_l31_max', 4132, 'u32', 0.1, 'VoltageL31_maxv'),  # V
+
+    # Min voltages
+    Field('voltage_l12_min', 4212, 'u32', 0.1, 'VoltageL12_minv'),  # V
+    Field('voltage_l23_min', 4216, 'u32', 0.1, 'VoltageL23_minv'),  # V
+    Field('voltage_l31_min', 4220, 'u32', 0.1, 'VoltageL31_minv'),  # V
+
+    # Current
+    Field('current_l1', 4020, 'u32', 0.001, 'CurrentL1_I'),  # A
+    Field('current_l2', 4022, 'u32', 0.001, 'CurrentL2_I'),  # A
+    Field('current_l3', 4024, 'u32', 0.001, 'CurrentL3_I'),  # A
+    Field('current_ln', 4026, 'u32', 0.001, 'CurrentLn_I'),  # A
+
+    # Power, scaled from W/VA/VAR to kW/kVA/kVAR as stored in SQL
+    Field('total_real_power', 4012, 'u32', 0.001, 'TotalRealPower_kWh'),  # kW
+    Field('total_apparent_power', 4014, 'u32', 0.001, 'TotalApparentPower_kWh'),  # kVA
+    Field('total_reactive_power', 4016, 'u32', 0.001, 'TotalReactivePower_kWh'),  # kVAR
+
+    # Power factor and frequency
+    Field('total_power_factor', 4018, 's16', 0.001, 'TotalPowerFactor_kWh'),
+    Field('frequency', 4019, 'u16', 0.01, 'Frequency'),  # Hz
+
+    # Energy
+    Field('total_real_energy', 4002, 'u32', 1, 'TotalRealEnergy'),  # kWh
+    Field('total_reactive_energy', 4010, 'u32', 1, 'TotalReactiveEnergy'),  # kVARh
+    Field('total_apparent_energy', 4006, 'u32', 1, 'TotalApparentEnergy'),  # kVAh
+)
+
+# struct format code and register count for each register type
+REGISTER_TYPES = {'u32': ('I', 2), 'u16': ('H', 1), 's16': ('h', 1)}
+
+MAX_BLOCK_SIZE = 125  # Modbus limit on registers per read request
+MAX_BLOCK_GAP = 16  # Unused registers worth reading through instead of sending another request
+
+def select_fields(names):
+    """Return the REGISTER_TABLE fields with the given names, in table order."""
+    names = set(names)
+    fields = tuple(field for field in REGISTER_TABLE if field.name in names)
+    missing = names - {field.name for field in fields}
+    if missing:
+        raise ValueError(f"Unknown RX380 fields: {', '.join(sorted(missing))}")
+    return fields
+
+class RegisterMap:
+    """Class to plan the block reads for a set of fields and decode them in one pass."""
+    def __init__(self, fields=REGISTER_TABLE, max_gap=MAX_BLOCK_GAP):
+        self.fields = tuple(fields)
+        self.blocks = []  # (start address, register count), one Modbus request each
+        fmt = '>'
+        by_address = sorted(self.fields, key=lambda field: field.address)
+        for field in by_address:
+            code, count = REGISTER_TYPES[field.type]
+            if self.blocks:
+                start_address, block_count = self.blocks[-1]
+                gap = field.address - (start_address + block_count)
+                if gap <= max_gap and field.address + count - start_address <= MAX_BLOCK_SIZE:
+                    self.blocks[-1] = (start_address, field.address + count - start_address)
+                    fmt += 'xx' * gap + code  # Pad bytes skip the unused registers
+                    continue
+            self.blocks.append((field.address, count))
+            fmt += code
+        self.struct = struct.Struct(fmt)
+        self.names = tuple(field.name for field in by_address)
+        self.scales = tuple(field.scale for field in by_address)
+
+    def decode(self, raw):
+        """Decode the concatenated big-endian register blocks into scaled values."""
+        return {
+            name: value * scale
+            for name, scale, value in zip(self.names, self.scales, self.struct.unpack(raw))
+        }
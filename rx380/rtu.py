@@ -0,0 +1,107 @@
+"""Asyncio Modbus RTU client, reading the serial port through pyserial-asyncio-fast."""
+import asyncio
+import logging
+import struct
+
+import serial_asyncio_fast
+
+logger = logging.getLogger(__name__)
+
+READ_INPUT_REGISTERS = 0x04
+EXCEPTION_LENGTH = 5  # Slave, function | 0x80, exception code, CRC
+
+def build_crc_table():
+    """Build the lookup table for the Modbus CRC16 (polynomial 0xA001, reflected)."""
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+CRC_TABLE = build_crc_table()
+
+def crc16(frame):
+    """Compute the Modbus CRC16 of frame."""
+    crc = 0xFFFF
+    for byte in frame:
+        crc = (crc >> 8) ^ CRC_TABLE[(crc ^ byte) & 0xFF]
+    return crc
+
+class RtuProtocol(asyncio.Protocol):
+    """Class to collect the response to one Modbus request at a time from the serial port."""
+    def __init__(self):
+        self.transport = None
+        self.buffer = bytearray()
+        self.expected_length = 0
+        self.response = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        if self.response is None or self.response.done():
+            return
+        # Exception responses are shorter than the data we asked for
+        if len(self.buffer) >= 2 and self.buffer[1] & 0x80:
+            self.expected_length = EXCEPTION_LENGTH
+        if len(self.buffer) >= self.expected_length:
+            self.response.set_result(bytes(self.buffer[:self.expected_length]))
+
+    def connection_lost(self, exc):
+        if self.response is not None and not self.response.done():
+            self.response.set_exception(exc or ConnectionError("Serial port closed"))
+
+    async def transact(self, frame, expected_length, timeout):
+        """Write a request frame and wait for expected_length bytes of response."""
+        self.buffer.clear()  # Drop any stale bytes from an earlier, timed out response
+        self.expected_length = expected_length
+        self.response = asyncio.get_running_loop().create_future()
+        try:
+            self.transport.write(frame)
+            return await asyncio.wait_for(self.response, timeout)
+        finally:
+            self.response = None
+
+class AsyncRtuClient:
+    """Class to send Modbus RTU requests to one slave without leaving the event loop."""
+    def __init__(self, port='/dev/ttyUSB0', slave_address=1, baudrate=19200, timeout=1):
+        self.port = port
+        self.slave_address = slave_address
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.protocol = None
+        self.lock = asyncio.Lock()  # The serial line carries one transaction at a time
+
+    async def connect(self):
+        """Open the serial port with the RX380's settings (8E1)."""
+        _, self.protocol = await serial_asyncio_fast.create_serial_connection(
+            asyncio.get_running_loop(), RtuProtocol, self.port,
+            baudrate=self.baudrate, bytesize=8, parity='E', stopbits=1
+        )
+        logger.info("Opened serial port %s", self.port)
+
+    async def read_input_bytes(self, address, count):
+        """Read count input registers starting at address, returning their raw big-endian bytes."""
+        frame = struct.pack('>BBHH', self.slave_address, READ_INPUT_REGISTERS, address, count)
+        frame += struct.pack('<H', crc16(frame))
+        async with self.lock:
+            if self.protocol is None or self.protocol.transport.is_closing():
+                await self.connect()
+            response = await self.protocol.transact(frame, 5 + 2 * count, self.timeout)
+
+        if crc16(response[:-2]) != struct.unpack('<H', response[-2:])[0]:
+            raise IOError(f"CRC mismatch in response to read of register {address}")
+        if response[1] & 0x80:
+            raise IOError(f"Modbus exception code {response[2]} reading register {address}")
+        if response[0] != self.slave_address or response[2] != 2 * count:
+            raise IOError(f"Unexpected response to read of register {address}")
+        return response[3:-2]
+
+    def close(self):
+        """Close the serial port, if open."""
+        if self.protocol is not None:
+            self.protocol.transport.close()
+            self.protocol = None
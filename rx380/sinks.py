@@ -0,0 +1,310 @@
+"""Destinations for RX380 readings: SQL Server, the daily CSV file and the terminal."""
+import asyncio
+import logging
+import os
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+
+import pymssql
+
+from .config import DEFAULT_CSV_FOLDER
+from .registers import REGISTER_TABLE
+
+logger = logging.getLogger(__name__)
+
+# json_dumps_line serializes one object to a line of compact JSON bytes, newline included
+try:
+    from orjson import OPT_APPEND_NEWLINE, dumps, loads as json_loads
+
+    def json_dumps_line(obj):
+        return dumps(obj, option=OPT_APPEND_NEWLINE)  # orjson adds the newline without copying
+except ImportError:  # orjson is optional, fall back to the standard library
+    import json
+    from json import loads as json_loads
+
+    def json_dumps_line(obj):
+        return (json.dumps(obj, separators=(',', ':')) + '\n').encode()
+
+# Spool size at which it is rotated aside, bounding disk use to about twice this
+MAX_SPOOL_SIZE = 10 * 1024 * 1024
+
+# Fail fast when the network drops, rather than tying up an I/O thread for minutes;
+# config.json's database section can override either
+SQL_TIMEOUTS = {'login_timeout': 5, 'timeout': 10}
+
+# Batches larger than this (e.g. a spool replay) go through bulk copy, smaller ones through
+# multi-row INSERT statements, which cost less to set up
+BULK_COPY_MIN_ROWS = 100
+
+# Shared by every CsvSink so flushes never interleave rows
+csv_lock = asyncio.Lock()
+
+def row_fields(fields=REGISTER_TABLE):
+    """Data keys making up a row, in column order: the timestamp, then each field."""
+    return ('timestamp',) + tuple(field.name for field in fields)
+
+def connect_sql(db_config):
+    """Connect to SQL Server with SQL_TIMEOUTS, unless db_config sets its own."""
+    return pymssql.connect(**{**SQL_TIMEOUTS, **db_config})
+
+def lookup_column_ids(cursor, table, columns):
+    """Look up the positions of columns in table, as bulk_copy expects."""
+    cursor.execute("SELECT name, column_id FROM sys.columns WHERE object_id = OBJECT_ID(%s)", (table,))
+    positions = {name.lower(): column_id for name, column_id in cursor.fetchall()}
+    return [positions[column.lower()] for column in columns]
+
+@lru_cache(maxsize=1)
+def get_filename(extension, day):
+    """Generate a filename for the given date (cached, as it only changes daily)."""
+    return f"rx380_data_{day.isoformat()}.{extension}"
+
+class SqlSink:
+    """Class to save rows to SQL Server from a background queue, spooling failed saves to disk."""
+    def __init__(self, db_config, fields=REGISTER_TABLE, table='Office_Readings', spool_file='unsaved_data.ndjson'):
+        self.db_config = db_config
+        self.table = table
+        self.columns = ('Timestamp',) + tuple(field.column for field in fields)
+        self.row_placeholders = "(" + ", ".join(["%s"] * len(self.columns)) + ")"
+        self.rows_per_insert = 2099 // len(self.columns)  # SQL Server allows at most 2100 parameters per statement
+        self.insert_queries = {}  # Row count -> multi-row INSERT statement
+        self.column_ids = None  # Cached on first bulk copy
+        self.conn = None  # Kept open across flushes, reopened after a connection error
+        self.cursor = None
+        self.sql_lock = asyncio.Lock()
+        self.queue = asyncio.Queue(maxsize=64)  # Batches of rows waiting for SQL Server
+        self.spool_file = Path(spool_file)  # Rows that failed to save, one JSON array per line
+        self.rotated_spool_file = self.spool_file.with_suffix('.1' + self.spool_file.suffix)
+        self.spool_lock = asyncio.Lock()  # Keeps a replay from deleting rows spooled while it runs
+        self.spool_tasks = set()  # Batches dropped from a full queue, being spooled
+        self.flusher = None
+
+    def start(self):
+        """Start the background task that saves queued rows to SQL Server."""
+        self.flusher = asyncio.create_task(self.flush_queue())
+
+    def enqueue(self, rows):
+        """Queue rows for the background SQL flush, spooling the oldest batch if full."""
+        if self.queue.full():
+            dropped = self.queue.get_nowait()
+            self.queue.task_done()
+            logger.error("SQL queue full, spooling the oldest %s records", len(dropped))
+            task = asyncio.create_task(self.spool(dropped))
+            self.spool_tasks.add(task)
+            task.add_done_callback(self.spool_tasks.discard)
+        self.queue.put_nowait(rows)
+
+    async def flush_queue(self):
+        """Save queued rows to SQL Server, merging all waiting batches into one insert."""
+        while True:
+            batches = [await self.queue.get()]
+            while not self.queue.empty():
+                batches.append(self.queue.get_nowait())
+            rows = [row for batch in batches for row in batch]
+            saved = False
+            try:
+                saved = await self.save_to_sql(rows)
+                if saved:
+                    await self.replay_spool()
+            except Exception as e:
+                # Keep the flusher alive, as close() waits on it to drain the queue
+                logger.error("Error flushing queued rows to SQL Server: %s", e)
+            finally:
+                if not saved:
+                    await self.spool(rows)
+                for _ in batches:
+                    self.queue.task_done()
+
+    async def spool(self, rows):
+        """Append rows to the spool file on a thread."""
+        async with self.spool_lock:
+            await asyncio.to_thread(self.spool_rows, rows)
+
+    def spool_rows(self, rows):
+        """Append rows that failed to save to the spool file, synced to disk before returning."""
+        try:
+            try:
+                if os.path.getsize(self.spool_file) >= MAX_SPOOL_SIZE:
+                    os.replace(self.spool_file, self.rotated_spool_file)
+                    logger.warning("Spool file rotated to %s, replacing any earlier rotation", self.rotated_spool_file)
+            except FileNotFoundError:
+                pass
+            # Whole lines go out in one append and are fsynced, so power loss can at most cut the last line short
+            fd = os.open(self.spool_file, os.O_RDWR | os.O_APPEND | os.O_CREAT | os.O_CLOEXEC, 0o644)
+            try:
+                data = b''.join(map(json_dumps_line, rows))
+                size = os.fstat(fd).st_size
+                if size and os.pread(fd, 1, size - 1) != b'\n':
+                    data = b'\n' + data  # End a line torn by power loss, so it doesn't swallow the first new row
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            logger.warning("%s records saved to spool file: %s", len(rows), self.spool_file)
+        except Exception as e:
+            logger.error("Failed to save unsaved data to spool file: %s", e)
+
+    def read_spool(self, spool_files):
+        """Load the rows in the spool files, skipping any partially written line."""
+        rows = []
+        for spool_file in spool_files:
+            with open(spool_file, 'rb') as spool:
+                for line in spool:
+                    try:
+                        rows.append(tuple(json_loads(line)))
+                    except ValueError:
+                        logger.warning("Skipping unreadable line in spool file: %r", line)
+        return rows
+
+    async def replay_spool(self):
+        """Save spooled rows to SQL Server now that it is reachable, then clear the spool."""
+        async with self.spool_lock:
+            spool_files = [path for path in (self.rotated_spool_file, self.spool_file) if path.is_file()]
+            if not spool_files:
+                return
+            rows = await asyncio.to_thread(self.read_spool, spool_files)
+            if not rows or await self.save_to_sql(rows):
+                for path in spool_files:
+                    await asyncio.to_thread(path.unlink)
+
+    async def close(self):
+        """Wait for queued rows to be saved or spooled, then stop the flusher and disconnect."""
+        if self.flusher is not None:
+            await self.queue.join()
+            self.flusher.cancel()
+            await asyncio.gather(self.flusher, return_exceptions=True)
+            self.flusher = None
+        await asyncio.gather(*self.spool_tasks)
+        await self.disconnect()
+
+    async def get_cursor(self):
+        """Return the cached cursor, connecting to SQL Server if needed."""
+        if self.conn is None:
+            self.conn = await asyncio.to_thread(connect_sql, self.db_config)
+            self.cursor = self.conn.cursor()
+        return self.cursor
+
+    async def disconnect(self):
+        """Close the SQL Server connection, if open."""
+        conn, self.conn, self.cursor = self.conn, None, None
+        if conn is not None:
+            try:
+                await asyncio.to_thread(conn.close)
+            except Exception as e:
+                logger.error("Error closing SQL Server connection: %s", e)
+
+    def get_column_ids(self, cursor):
+        """Return the positions of the columns in the table, looked up on first use."""
+        if self.column_ids is None:
+            self.column_ids = lookup_column_ids(cursor, self.table, self.columns)
+        return self.column_ids
+
+    def build_insert_query(self, row_count):
+        """Build the INSERT statement for a chunk of row_count rows (cached per size)."""
+        query = self.insert_queries.get(row_count)
+        if query is None:
+            query = self.insert_queries[row_count] = (
+                f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES "
+                + ", ".join([self.row_placeholders] * row_count)
+            )
+        return query
+
+    def insert_rows(self, conn, cursor, rows):
+        """Insert rows via bulk copy if there are many, else via multi-row INSERT statements."""
+        if len(rows) > BULK_COPY_MIN_ROWS and hasattr(conn, 'bulk_copy'):
+            conn.bulk_copy(self.table, rows, column_ids=self.get_column_ids(cursor), batch_size=1000)
+            return
+        for chunk_start in range(0, len(rows), self.rows_per_insert):
+            chunk = rows[chunk_start:chunk_start + self.rows_per_insert]
+            cursor.execute(self.build_insert_query(len(chunk)), tuple(value for row in chunk for value in row))
+
+    async def save_to_sql(self, rows):
+        """Save rows in column order to SQL Server, returning whether it succeeded."""
+        async with self.sql_lock:
+            for attempt in range(2):  # Retry once on a fresh connection, as an idle one may have dropped
+                try:
+                    cursor = await self.get_cursor()
+                    await asyncio.to_thread(self.insert_rows, self.conn, cursor, rows)
+                    await asyncio.to_thread(self.conn.commit)
+                    logger.info("Data inserted successfully into SQL Server! (%s records)", len(rows))
+                    return True
+                except (pymssql.OperationalError, pymssql.InterfaceError) as e:
+                    logger.error("SQL Server connection error (attempt %s): %s", attempt + 1, e)
+                    await self.disconnect()
+                except Exception as e:
+                    logger.error("Error inserting data into SQL Server: %s", e)
+                    try:
+                        if self.conn is not None:
+                            await asyncio.to_thread(self.conn.rollback)
+                    except Exception as e:
+                        logger.error("Rollback failed, reconnecting on next save: %s", e)
+                        await self.disconnect()
+                    return False
+            return False
+
+class CsvSink:
+    """Class to append rows to the daily CSV file, kept open between writes."""
+    def __init__(self, folder_path=None, fields=REGISTER_TABLE):
+        if folder_path is None:
+            folder_path = DEFAULT_CSV_FOLDER
+        self.folder_path = Path(folder_path)
+        keys = row_fields(fields)
+        self.header = ",".join(keys) + "\r\n"  # Same line ending csv.writer used
+        self.row_format = ",".join(["{}"] * len(keys)) + "\r\n"
+        self.duplicate_format = "{},DUP\r\n"  # Timestamp only, the values are as in the row above
+        self.filename = None
+        self.file = None
+        self.date = None
+
+    def open(self):
+        """Open today's CSV file, writing the header if the file is new."""
+        self.close()
+        self.folder_path.mkdir(parents=True, exist_ok=True)
+        self.date = date.today()
+        self.filename = self.folder_path / get_filename("csv", self.date)
+        file_exists = self.filename.is_file()
+        self.file = open(self.filename, 'a', newline='', buffering=1 << 16)
+        if not file_exists:
+            self.file.write(self.header)
+
+    def write_rows(self, rows, duplicate=False):
+        """Write rows to the CSV file, or just DUP markers if duplicate, rolling over at date change."""
+        if self.file is None or self.date != date.today():
+            self.open()
+            duplicate = False  # Start each file with full rows, so a DUP marker never refers to another file
+        # Values are numbers and a timestamp, so no CSV quoting is needed;
+        # duplicate_format uses the timestamp and ignores the rest of the row
+        line_format = self.duplicate_format if duplicate else self.row_format
+        self.file.write("".join([line_format.format(*row) for row in rows]))
+        self.file.flush()
+
+    async def write(self, rows, duplicate=False):
+        """Save rows in column order to the CSV file, or DUP markers for rows unchanged since the last."""
+        async with csv_lock:
+            await asyncio.to_thread(self.write_rows, rows, duplicate)
+        logger.info("Data saved to CSV file: %s", self.filename)
+
+    def close(self):
+        """Close the CSV file, if open."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class ConsoleDisplay:
+    """Class to print a summary of the latest reading to the terminal every few readings."""
+    def __init__(self, every=12):
+        self.every = every
+        self.counter = 0
+
+    def show(self, data):
+        """Count a reading, printing it if a summary is due."""
+        self.counter += 1
+        if self.counter < self.every:
+            return
+        self.counter = 0
+        print(f"\nRX380 Readings at {data['timestamp']}:")
+        print(f"Line Voltage (V): L12={data['voltage_l12']:.1f}, L23={data['voltage_l23']:.1f}, L31={data['voltage_l31']:.1f}")
+        print(f"Current (A): L1={data['current_l1']:.2f}, L2={data['current_l2']:.2f}, L3={data['current_l3']:.2f}")
+        print(f"Total Real Power: {data['total_real_power']:.3f} kW")
+        print(f"Total Power Factor: {data['total_power_factor']:.3f}")
+        print(f"Frequency: {data['frequency']:.2f} Hz")